@@ -1,9 +1,32 @@
 """
 TechCrunch AI & Startup Newsletter Generator
 A simple agentic framework using Ollama's web search and web fetch APIs
+
+Every chat request starts with the same system prompt. Ollama renders the
+tools spec into the prompt, so the server can reuse the KV cache for the
+prefix only among requests with the same tools: within the stage-1 tool
+loop (system prompt + TOOLS_SPEC), and among the tool-less ranking and
+summary calls (system prompt only). Start `ollama serve` with OLLAMA_KV_CACHE_TYPE=q8_0 to
+halve the memory of that cache if the context window gets tight.
+
+Detailed summaries and tool calls are requested concurrently. The server
+only serves them in parallel when started with OLLAMA_NUM_PARALLEL > 1;
+otherwise it queues them. Both OLLAMA_NUM_PARALLEL (default 4) and
+OLLAMA_MAX_LOADED_MODELS (default 2) can be set in .env (see .env.example).
+They only take effect on a server started with them, so either export them
+before running `ollama serve`, or set START_OLLAMA_SERVER=1 to have this
+script launch the server itself with those settings.
+
+Before the detailed summaries, article passages are ranked against their
+story with the EMBED_MODEL embedding model (`ollama pull mxbai-embed-large`)
+and only the most relevant ones are passed to MODEL.
 """
 
-from ollama import Client
+import asyncio
+import subprocess
+import httpx
+import ollama
+from ollama import Tool
 from datetime import datetime, timedelta
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -11,6 +34,13 @@ from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.enums import TA_JUSTIFY, TA_CENTER
 import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+from xml.sax.saxutils import escape, quoteattr
+from markdown_it import MarkdownIt
 from dotenv import load_dotenv
 
 load_dotenv() 
@@ -19,6 +49,66 @@ load_dotenv()
 # Configuration
 MODEL = 'gpt-oss:20b'
 TECHCRUNCH_DOMAIN = 'techcrunch.com'
+CACHE_DB = os.getenv('NEWSLETTER_CACHE_DB', '.newsletter_cache.sqlite')
+RESPONSE_CACHE_TTL = 6 * 3600  # seconds
+TOOL_CACHE_TTL = 6 * 3600  # seconds
+CACHE_MAX_AGE = 7 * 24 * 3600  # seconds; weekly stage entries can no longer be hit after this
+STALE_TOOL_RESULT_CHARS = 500  # tool results the model already answered are cut to this
+PREFETCH_LIMIT = 10  # article URLs from stage 1 fetched in the background
+EMBED_MODEL = 'mxbai-embed-large'  # cheap model used to pick article passages for stage 3
+EMBED_QUERY_PREFIX = 'Represent this sentence for searching relevant passages: '  # mxbai-embed-large retrieval queries
+ARTICLE_TOP_K = 5  # passages per article passed to the summary model
+PASSAGE_CHARS = 500
+NUM_CTX = 16384  # keep fixed: changing it between calls reloads the model and drops the KV cache
+
+# Ollama server parallelism, applied to a server launched by this script
+os.environ.setdefault('OLLAMA_NUM_PARALLEL', '4')
+os.environ.setdefault('OLLAMA_MAX_LOADED_MODELS', '2')
+START_OLLAMA_SERVER = os.getenv('START_OLLAMA_SERVER', '').lower() in ('1', 'true', 'yes')
+
+# Static request prefix, byte-identical across every chat call.
+# Per-stage instructions belong in the user message, not here.
+# TOOLS_SPEC only extends the shared prefix for the tool-using stage 1;
+# stages 2 and 3 send no tools, so they share the system prompt alone.
+SYSTEM_PROMPT = 'You are a tech news analyst. Focus on finding breakthrough news about AI and technology startups from TechCrunch.'
+
+# Validated into ollama Tool models once, so chat() does not re-parse the dicts per call
+TOOLS_SPEC = [Tool.model_validate(tool) for tool in [
+    {
+        'type': 'function',
+        'function': {
+            'name': 'web_search',
+            'description': 'Search the web for information',
+            'parameters': {
+                'type': 'object',
+                'properties': {
+                    'query': {
+                        'type': 'string',
+                        'description': 'Search query'
+                    }
+                },
+                'required': ['query']
+            }
+        }
+    },
+    {
+        'type': 'function',
+        'function': {
+            'name': 'web_fetch',
+            'description': 'Fetch content from a specific URL',
+            'parameters': {
+                'type': 'object',
+                'properties': {
+                    'url': {
+                        'type': 'string',
+                        'description': 'URL to fetch'
+                    }
+                },
+                'required': ['url']
+            }
+        }
+    }
+]]
 
 # Setup Ollama API key
 OLLAMA_API_KEY = os.getenv('OLLAMA_API_KEY')
@@ -29,20 +119,240 @@ if not OLLAMA_API_KEY:
     print("   2. Set env variable- i.e: in PowerShell: $env:OLLAMA_API_KEY='your_api_key'")
     raise ValueError("OLLAMA_API_KEY environment variable is required")
 
-# Initialize Ollama client with API key
-client = Client()
+# Initialize Ollama client with API key.
+# One pooled HTTP/2 transport is shared by chat and tool calls; the ollama.com
+# web_search / web_fetch endpoints multiplex over a single TLS connection.
+client = ollama.AsyncClient(
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=3,
+        limits=httpx.Limits(max_keepalive_connections=40, max_connections=100, keepalive_expiry=30.0)
+    ),
+    timeout=httpx.Timeout(300.0, connect=10.0)
+)
+
+# Local SQLite cache, opened lazily on first use
+_cache_conn = None
+
+
+def _cache_db():
+    """
+    Return the shared cache connection, creating the table and purging
+    expired entries on first use
+    """
+    global _cache_conn
+    if _cache_conn is None:
+        _cache_conn = sqlite3.connect(CACHE_DB)
+        _cache_conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)'
+        )
+        now = time.time()
+        _cache_conn.execute(
+            "DELETE FROM cache WHERE created < ? "
+            "OR (key LIKE 'response-%' AND created < ?) "
+            "OR (key LIKE 'web\\_%' ESCAPE '\\' AND created < ?)",
+            (now - CACHE_MAX_AGE, now - RESPONSE_CACHE_TTL, now - TOOL_CACHE_TTL)
+        )
+        _cache_conn.commit()
+    return _cache_conn
+
+
+def _cache_get(key, ttl=None):
+    """
+    Return the cached value for key, or None if missing or older than ttl seconds
+    """
+    row = _cache_db().execute('SELECT value, created FROM cache WHERE key=?', (key,)).fetchone()
+    if row is None or (ttl is not None and time.time() - row[1] > ttl):
+        return None
+    return json.loads(row[0])
+
+
+def _cache_set(key, value):
+    """
+    Store a JSON-serializable value under key
+    """
+    db = _cache_db()
+    db.execute(
+        'INSERT OR REPLACE INTO cache (key, value, created) VALUES (?, ?, ?)',
+        (key, json.dumps(value), time.time())
+    )
+    db.commit()
+
+
+def _stage_key(stage, inputs=None):
+    """
+    Cache key of a pipeline stage's output for the current ISO week.
+    If given, a hash of the JSON-serializable inputs is appended, so the entry
+    is never served for different inputs.
+    Delete the cache file to regenerate a week's newsletter from scratch.
+    """
+    key = f"{stage}-{MODEL}-{datetime.now().strftime('%G-W%V')}"
+    if inputs is not None:
+        key += '-' + hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()[:16]
+    return key
+
+
+def _collapse_whitespace(text):
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+
+def _compact_tool_result(tool_name, result, max_items=8, max_chars=6000):
+    """
+    Reduce a web_search / web_fetch result to the fields the model needs,
+    instead of feeding it the repr of the whole response
+    """
+    if tool_name == 'web_search':
+        lines = []
+        for item in (result.get('results') or [])[:max_items]:
+            snippet = _collapse_whitespace(item.get('content') or item.get('snippet'))[:400]
+            lines.append(f"- {item.get('title') or ''}\n  {item.get('url') or ''}\n  {snippet}")
+        text = "\n".join(lines) or "No results"
+    elif tool_name == 'web_fetch':
+        content = _collapse_whitespace(result.get('content'))[:4000]
+        text = f"{result.get('title') or ''}\n{content}"
+    else:
+        text = str(result)
+    return text[:max_chars]
+
+
+async def cached_web_search(query, ttl=TOOL_CACHE_TTL):
+    """
+    web_search returning the compacted result, cached on disk by query
+    """
+    key = 'web_search-' + hashlib.sha256(query.encode()).hexdigest()
+    cached = _cache_get(key, ttl=ttl)
+    if cached is not None:
+        print(f"Cached search: {query}")
+        return cached
+    
+    result = await client.web_search(query=query)
+    print(f"Found {len(result.get('results') or [])} results")
+    text = _compact_tool_result('web_search', result)
+    _cache_set(key, text)
+    return text
 
 
-def create_search_agent(query, context=""):
+async def cached_web_fetch(url, ttl=TOOL_CACHE_TTL):
     """
-    Simple search agent that uses web_search and web_fetch
+    web_fetch returning the compacted page, cached on disk by URL
+    """
+    key = 'web_fetch-' + hashlib.sha256(url.encode()).hexdigest()
+    cached = _cache_get(key, ttl=ttl)
+    if cached is not None:
+        print(f"Cached fetch: {url}")
+        return cached
+    
+    result = await client.web_fetch(url=url)
+    print(f"Fetched content")
+    text = _compact_tool_result('web_fetch', result)
+    _cache_set(key, text)
+    return text
+
+
+# web_fetch tasks started during this run, keyed by URL
+_fetch_tasks = {}
+
+
+def prefetch_web_fetch(url):
+    """
+    Start a background cached_web_fetch for url, or return the one already started
+    """
+    task = _fetch_tasks.get(url)
+    if task is None or (task.done() and not task.cancelled() and task.exception() is not None):
+        task = _fetch_tasks[url] = asyncio.create_task(cached_web_fetch(url))
+    return task
+
+
+def _cancel_prefetches():
+    """
+    Cancel background fetches nobody ended up awaiting
+    """
+    for task in _fetch_tasks.values():
+        if task.done():
+            if not task.cancelled():
+                task.exception()  # mark any failure as retrieved
+        else:
+            task.cancel()
+    _fetch_tasks.clear()
+
+
+_TECHCRUNCH_URL_RE = re.compile(r'https?://(?:www\.)?' + re.escape(TECHCRUNCH_DOMAIN) + r'/[^\s)\]>"\'<]+')
+
+
+def _extract_techcrunch_urls(text):
+    """
+    Return the unique TechCrunch article URLs mentioned in text, in order
+    """
+    urls = (url.rstrip('.,;:') for url in _TECHCRUNCH_URL_RE.findall(text or ''))
+    return list(dict.fromkeys(urls))
+
+
+def _compact_stale_tool_messages(messages, indices):
+    """
+    Shrink tool results the model has already responded to, so the transcript
+    re-sent on every iteration stays around one turn's worth of tool output
+    """
+    for idx in indices:
+        content = messages[idx]['content']
+        if len(content) > STALE_TOOL_RESULT_CHARS:
+            messages[idx] = {
+                **messages[idx],
+                'content': f"{content[:STALE_TOOL_RESULT_CHARS]}... [earlier result, {len(content)} chars]"
+            }
+
+
+def _normalize(response):
+    """
+    Flatten a chat response (object or dict) into {'content', 'tool_calls', 'raw'}
+    """
+    message = response.get('message') if isinstance(response, dict) else getattr(response, 'message', None)
+    if isinstance(message, dict):
+        # Validate into a Message so tool calls expose .function.name / .arguments too
+        message = ollama.Message.model_validate(message)
+    return {
+        'content': getattr(message, 'content', None) or '',
+        'tool_calls': getattr(message, 'tool_calls', None) or [],
+        'raw': message
+    }
+
+
+async def _run_tool(tool_call):
+    """
+    Execute one tool call and return the content of its tool message
+    """
+    tool_name = tool_call.function.name
+    args = tool_call.function.arguments
+    
+    try:
+        if tool_name == 'web_search':
+            print(f"Searching: {args.get('query', '')}")
+            return await cached_web_search(args['query'])
+        elif tool_name == 'web_fetch':
+            print(f"   Fetching: {args.get('url', '')}")
+            return await prefetch_web_fetch(args['url'])
+        else:
+            return f'Error: Unknown tool: {tool_name}'
+    except Exception as e:
+        print(f"Tool error: {str(e)}")
+        return f'Error: {str(e)}'
+
+
+async def create_search_agent(query, context="", response_format=None, temperature=0.7,
+                              use_tools=True, max_iterations=5, validate=None):
+    """
+    Simple search agent that uses web_search and web_fetch.
+    Pass response_format='json' to constrain the model's answer to valid JSON, and
+    use_tools=False for pure post-processing of the context (a single chat call).
+    If given, validate(final_content) must return True for the answer to be cached.
     """
     messages = [
         {
             'role': 'system',
-            'content': 'You are a tech news analyst. Focus on finding breakthrough news about AI and technology startups from TechCrunch.'
+            'content': SYSTEM_PROMPT
         },
         {
+            # Context first, query last, so shared context extends the cached prefix
             'role': 'user',
             'content': f"{context}\n\n{query}" if context else query
         }
@@ -50,103 +360,66 @@ def create_search_agent(query, context=""):
     
     print(f"\nQuery: {query}")
     
+    # Skip the model entirely if this exact prompt was answered recently
+    cache_key = 'response-' + hashlib.sha256(
+        f"{MODEL}|{response_format}|{temperature}|{use_tools}|{messages[0]['content']}|{messages[1]['content']}".encode()
+    ).hexdigest()
+    cached = _cache_get(cache_key, ttl=RESPONSE_CACHE_TTL)
+    if cached:
+        print("Using cached response")
+        return cached, []
+    
     conversation_history = []
-    max_iterations = 5
     iteration = 0
+    pending_tool_indices = []
     
     while iteration < max_iterations:
         iteration += 1
         
-        response = client.chat(
+        response = await client.chat(
             model=MODEL,
             messages=messages,
-            tools=[
-                {
-                    'type': 'function',
-                    'function': {
-                        'name': 'web_search',
-                        'description': 'Search the web for information',
-                        'parameters': {
-                            'type': 'object',
-                            'properties': {
-                                'query': {
-                                    'type': 'string',
-                                    'description': 'Search query'
-                                }
-                            },
-                            'required': ['query']
-                        }
-                    }
-                },
-                {
-                    'type': 'function',
-                    'function': {
-                        'name': 'web_fetch',
-                        'description': 'Fetch content from a specific URL',
-                        'parameters': {
-                            'type': 'object',
-                            'properties': {
-                                'url': {
-                                    'type': 'string',
-                                    'description': 'URL to fetch'
-                                }
-                            },
-                            'required': ['url']
-                        }
-                    }
-                }
-            ],
-            options={'temperature': 0.7}
+            tools=TOOLS_SPEC if use_tools else None,
+            format='json' if response_format == 'json' else None,
+            options={'temperature': temperature, 'num_ctx': NUM_CTX}
         )
         
-        if hasattr(response, 'message') and hasattr(response.message, 'content') and response.message.content:
-            print(f"Response: {response.message.content[:200]}...")
-            conversation_history.append(response.message.content)
+        # The previous turn's tool results have now been consumed
+        _compact_stale_tool_messages(messages, pending_tool_indices)
+        pending_tool_indices = []
         
-        messages.append(response.message)
+        message = _normalize(response)
         
-        if hasattr(response.message, 'tool_calls') and response.message.tool_calls:
-            print(f"Using tools: {[tc.function.name for tc in response.message.tool_calls]}")
+        if message['content']:
+            print(f"Response: {message['content'][:200]}...")
+            conversation_history.append(message['content'])
+        
+        messages.append(message['raw'])
+        
+        if message['tool_calls']:
+            print(f"Using tools: {[tc.function.name for tc in message['tool_calls']]}")
+            
+            # Independent tool calls overlap; results come back in request order
+            results = await asyncio.gather(*(_run_tool(tc) for tc in message['tool_calls']))
             
-            for tool_call in response.message.tool_calls:
-                tool_name = tool_call.function.name
-                args = tool_call.function.arguments
-                
-                try:
-                    if tool_name == 'web_search':
-                        print(f"Searching: {args.get('query', '')}")
-                        result = client.web_search(query=args['query'])
-                        print(f"Found {len(result.get('results', []))} results")
-                    elif tool_name == 'web_fetch':
-                        print(f"   Fetching: {args.get('url', '')}")
-                        result = client.web_fetch(url=args['url'])
-                        print(f"Fetched content")
-                    else:
-                        result = {'error': f'Unknown tool: {tool_name}'}
-                    
-                    # Truncate for context limits
-                    result_str = str(result)[:8000]
-                    
-                    messages.append({
-                        'role': 'tool',
-                        'content': result_str
-                    })
-                    
-                except Exception as e:
-                    print(f"Tool error: {str(e)}")
-                    messages.append({
-                        'role': 'tool',
-                        'content': f'Error: {str(e)}'
-                    })
+            for tool_call, result_str in zip(message['tool_calls'], results):
+                pending_tool_indices.append(len(messages))
+                messages.append({
+                    'role': 'tool',
+                    'tool_name': tool_call.function.name,
+                    'content': result_str
+                })
         else:
             # No more tool calls, we're done
             break
     
-    final_content = response.message.content if hasattr(response.message, 'content') else ""
+    final_content = message['content']
+    if final_content and (validate is None or validate(final_content)):
+        _cache_set(cache_key, final_content)
     return final_content, conversation_history
 
 
-def gather_techcrunch_news():
+async def gather_techcrunch_news():
     """
     Step 1: Search for recent TechCrunch AI and startup news
     """
@@ -154,67 +427,363 @@ def gather_techcrunch_news():
     print("GATHERING TECHCRUNCH NEWS")
     print("="*60)
     
+    key = _stage_key('gather')
+    cached = _cache_get(key)
+    if cached is not None:
+        print("Using this week's cached news")
+        return cached
+    
     # Get date range for last week
     today = datetime.now()
     week_ago = today - timedelta(days=7)
     
     query = f"site:techcrunch.com artificial intelligence startups latest news"
     
-    result, history = create_search_agent(
+    result, history = await create_search_agent(
         query,
         context="Find the most important AI and startup news from TechCrunch in the last week. Focus on breakthrough announcements, funding rounds, and major product launches."
     )
     
+    if result:
+        _cache_set(key, result)
     return result
 
 
-def analyze_and_rank_news(news_data):
+_STORY_FIELDS = ('title', 'summary', 'importance', 'url')
+
+
+def _as_text(value):
     """
-    Step 2: Have the AI analyze and identify the most important stories
+    Coerce a model-supplied JSON value (string, number, list, null) into plain text
+    """
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ' '.join(_as_text(item) for item in value)
+    return str(value)
+
+
+def _parse_stories(text):
+    """
+    Parse the stories returned by the ranking stage, either {"stories": [...]} or a bare array.
+    Returns (stories, parsed); if the model strayed from JSON, stories is a single
+    story holding the raw text and parsed is False.
+    """
+    data = None
+    try:
+        data = json.loads(text)
+    except ValueError:
+        start, end = text.find('['), text.rfind(']')
+        if start != -1 and end > start:
+            try:
+                data = json.loads(text[start:end + 1])
+            except ValueError:
+                pass
+    
+    if isinstance(data, dict):
+        data = data.get('stories')
+    if isinstance(data, list) and data and all(isinstance(s, dict) for s in data):
+        return [{**story, **{field: _as_text(story.get(field)) for field in _STORY_FIELDS}}
+                for story in data], True
+    
+    return [{'title': '', 'summary': text, 'importance': '', 'url': ''}], False
+
+
+async def analyze_and_rank_news(news_data):
+    """
+    Step 2: Have the AI analyze and identify the most important stories.
+    Returns (stories, parsed); parsed is False if the model's answer was not JSON stories.
     """
     print("\n" + "="*60)
     print("ANALYZING & RANKING NEWS")
     print("="*60)
     
+    key = _stage_key('rank')
+    cached = _cache_get(key)
+    if cached is not None:
+        print("Using this week's cached ranking")
+        return cached, True
+    
     query = """Based on the news you found, identify the TOP 5 most important and breakthrough stories.
     
     For each story, provide:
-    1. Title
-    2. Brief summary (2-3 sentences)
-    3. Why it's important
-    4. Source URL
+    1. title
+    2. summary: a brief summary (2-3 sentences)
+    3. importance: why it's important
+    4. url: the source URL
     
-    Focus on: Major funding announcements, breakthrough AI technologies, significant partnerships, and disruptive startups."""
+    Focus on: Major funding announcements, breakthrough AI technologies, significant partnerships, and disruptive startups.
     
-    result, history = create_search_agent(query, context=news_data)
+    Return ONLY a JSON object of the form {"stories": [...]}, where each story is an object with keys: title, summary, importance, url."""
     
-    return result
+    result, history = await create_search_agent(
+        query,
+        context=news_data,
+        response_format='json',
+        temperature=0.2,
+        use_tools=False,
+        max_iterations=1,
+        validate=lambda text: _parse_stories(text)[1]
+    )
+    
+    stories, parsed = _parse_stories(result)
+    if parsed:
+        print(f"Ranked {len(stories)} stories")
+        _cache_set(key, stories)
+    else:
+        print("WARNING: ranking stage did not return JSON stories, summarizing it as one block")
+    return stories, parsed
 
 
-def create_detailed_summaries(ranked_news):
+async def _fetch_article(story):
     """
-    Step 3: Create detailed summaries of top stories
+    Return the fetched article text of a story, or '' if it has no URL or the fetch failed
     """
-    print("\n" + "="*60)
-    print("CREATING DETAILED SUMMARIES")
-    print("="*60)
+    if not story.get('url'):
+        return ''
+    # Usually already prefetched while the ranking stage was running
+    try:
+        return await prefetch_web_fetch(story['url'])
+    except Exception as e:
+        print(f"Could not fetch {story['url']}: {str(e)}")
+        return ''
+
+
+def _split_passages(text, size=PASSAGE_CHARS):
+    """
+    Split article text into passages of whole sentences, about size chars each
+    """
+    passages, current = [], ''
+    for sentence in re.split(r'(?<=[.!?])\s+', text):
+        if current and len(current) + len(sentence) > size:
+            passages.append(current)
+            current = ''
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        passages.append(current)
+    return passages
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = (sum(x * x for x in a) * sum(y * y for y in b)) ** 0.5
+    return dot / norm if norm else 0.0
+
+
+async def select_relevant_passages(stories, articles, top_k=ARTICLE_TOP_K):
+    """
+    Trim each article to the top_k passages most similar to its story, in article order.
+    All passages of all stories are embedded with one batched embed call.
+    """
+    inputs, spans = [], []
+    for story, article in zip(stories, articles):
+        passages = _split_passages(article)
+        if len(passages) <= top_k:
+            spans.append(None)
+            continue
+        spans.append((len(inputs), passages))
+        # Only the query gets the retrieval prefix; passages are embedded as-is
+        inputs.append(f"{EMBED_QUERY_PREFIX}{story.get('title', '')}. {story.get('summary', '')}")
+        inputs.extend(passages)
     
-    query = """For each of the top stories you identified, create a detailed summary (4-5 sentences) that includes:
+    if not inputs:
+        return articles
+    
+    try:
+        response = await client.embed(model=EMBED_MODEL, input=inputs)
+        embeddings = response['embeddings']
+    except Exception as e:
+        print(f"Embedding failed, using full articles: {str(e)}")
+        return articles
+    
+    selected = []
+    for article, span in zip(articles, spans):
+        if span is None:
+            selected.append(article)
+            continue
+        start, passages = span
+        query_embedding = embeddings[start]
+        scores = [_cosine(query_embedding, emb) for emb in embeddings[start + 1:start + 1 + len(passages)]]
+        best = sorted(sorted(range(len(passages)), key=scores.__getitem__, reverse=True)[:top_k])
+        selected.append("\n".join(passages[i] for i in best))
+    return selected
+
+
+async def create_single_summary(story, article=''):
+    """
+    Add the detailed summary of one ranked story under 'detailed_summary'.
+    On failure it is left empty, so the report falls back to the brief summary.
+    """
+    query = """Create a detailed summary (4-5 sentences) of the story above that includes:
     - What happened
     - Who is involved
     - Why it matters for the AI and startup ecosystem
     - Potential impact
     
-    Format each story clearly with the title, URL, and detailed summary."""
+    Output only the summary text, without the title or URL."""
     
-    result, history = create_search_agent(query, context=ranked_news)
+    context = json.dumps(story, indent=2)
+    if article:
+        context += f"\n\nArticle:\n{article}"
     
-    return result
+    try:
+        result, history = await create_search_agent(query, context=context, use_tools=False, max_iterations=1)
+    except Exception as e:
+        print(f"Summary failed for {story.get('title') or 'story'}: {str(e)}")
+        result = ''
+    
+    return {**story, 'detailed_summary': result}
+
+
+async def create_detailed_summaries(stories, cache=True):
+    """
+    Step 3: Create detailed summaries of top stories, one concurrent request per story.
+    Pass cache=False when the stories are not a real ranking, so the result is not stored.
+    """
+    print("\n" + "="*60)
+    print("CREATING DETAILED SUMMARIES")
+    print("="*60)
+    
+    key = _stage_key('summaries', stories)
+    cached = _cache_get(key)
+    if cached is not None:
+        print("Using this week's cached summaries")
+        return cached
+    
+    articles = await asyncio.gather(*[_fetch_article(story) for story in stories])
+    # Only the most relevant passages reach the large chat model
+    articles = await select_relevant_passages(stories, articles)
+    
+    summaries = list(await asyncio.gather(*[
+        create_single_summary(story, article) for story, article in zip(stories, articles)
+    ]))
+    
+    # Only complete runs over a parsed ranking are stored, so a rerun retries the rest
+    if cache and all(summary.get('detailed_summary') for summary in summaries):
+        _cache_set(key, summaries)
+    return summaries
+
+
+# PDF styles, built once at import
+_STYLES = getSampleStyleSheet()
+_STYLES.add(ParagraphStyle(name='Justify', alignment=TA_JUSTIFY))
+
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_STYLES['Heading1'],
+    fontSize=24,
+    textColor="#1B1B1B",
+    spaceAfter=30,
+    alignment=TA_CENTER
+)
+
+HEADING_STYLE = ParagraphStyle(
+    'CustomHeading',
+    parent=_STYLES['Heading2'],
+    fontSize=14,
+    textColor="#1B1B1B",
+    spaceAfter=12
+)
+
+BODY_STYLE = ParagraphStyle(
+    'CustomBody',
+    parent=_STYLES['Normal'],
+    fontSize=11,
+    leading=14,
+    spaceAfter=10
+)
+
+# Inline markdown tokens mapped to ReportLab paragraph markup
+_MARKDOWN = MarkdownIt()
+_INLINE_TAGS = {
+    'strong_open': '<b>', 'strong_close': '</b>',
+    'em_open': '<i>', 'em_close': '</i>',
+    'link_close': '</a>',
+    'softbreak': ' ', 'hardbreak': '<br/>'
+}
+
+
+def _render_inline(token):
+    """
+    Convert an inline markdown token into ReportLab paragraph markup
+    """
+    parts = []
+    for child in token.children or []:
+        if child.type in ('text', 'html_inline', 'image'):
+            # image content is its alt text
+            parts.append(escape(child.content))
+        elif child.type == 'code_inline':
+            parts.append(f'<font face="Courier">{escape(child.content)}</font>')
+        elif child.type == 'link_open':
+            parts.append(f'<a href={quoteattr(child.attrGet("href") or "")}>')
+        else:
+            parts.append(_INLINE_TAGS.get(child.type, ''))
+    return ''.join(parts).strip()
+
+
+def _iter_paragraph_flowables(content, heading_style, body_style):
+    """
+    Lazily yield one Paragraph per markdown block of the newsletter content
+    """
+    style = body_style
+    prefix = ''
+    for token in _MARKDOWN.parse(content):
+        if token.type == 'heading_open':
+            style = heading_style
+        elif token.type == 'list_item_open':
+            # info holds the item number in ordered lists
+            prefix = f"{token.info}. " if token.info else '• '
+        elif token.type == 'html_block' and token.content.strip():
+            yield Paragraph(escape(token.content.strip()), body_style)
+        elif token.type in ('fence', 'code_block'):
+            code = escape(token.content.rstrip()).replace('\n', '<br/>')
+            yield Paragraph(f'<font face="Courier">{code}</font>', body_style)
+        elif token.type == 'inline':
+            text = _render_inline(token)
+            if text:
+                yield Paragraph(prefix + text, style)
+            style = body_style
+            prefix = ''
+
+
+def _iter_story_flowables(stories, heading_style, body_style):
+    """
+    Yield the Paragraphs for a list of story dicts, one section per story
+    """
+    for number, story in enumerate(stories, 1):
+        title = _as_text(story.get('title')) or f"Story {number}"
+        yield Paragraph(escape(f"{number}. {title}"), heading_style)
+        
+        # Summaries are free-form model text and may contain markdown
+        summary = _as_text(story.get('detailed_summary')) or _as_text(story.get('summary'))
+        if summary:
+            yield from _iter_paragraph_flowables(summary, body_style, body_style)
+        importance = _as_text(story.get('importance'))
+        if importance:
+            yield Paragraph(escape(f"Why it matters: {importance}"), body_style)
+        url = _as_text(story.get('url'))
+        if url:
+            yield Paragraph(escape(f"Source: {url}"), body_style)
+
+
+def _load_stories(content):
+    """
+    Return content as a list of story dicts if it is one (or its JSON encoding), else None
+    """
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except ValueError:
+            return None
+    if isinstance(content, list) and all(isinstance(s, dict) for s in content):
+        return content
+    return None
 
 
 def generate_pdf_report(content):
     """
-    Generate a PDF report from the newsletter content
+    Generate a PDF report from the newsletter content.
+    Accepts a list of story dicts (or its JSON string), or free-form markdown text.
     """
     print("\n" + "="*60)
     print("📄 GENERATING PDF REPORT")
@@ -228,68 +797,18 @@ def generate_pdf_report(content):
     # Container for the 'Flowable' objects
     elements = []
     
-    # Define styles
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='Justify', alignment=TA_JUSTIFY))
-    
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor="#1B1B1B",
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor="#1B1B1B",
-        spaceAfter=12
-    )
-    
-    body_style = ParagraphStyle(
-        'CustomBody',
-        parent=styles['Normal'],
-        fontSize=11,
-        leading=14,
-        spaceAfter=10
-    )
-    
     # Add title and date
-    elements.append(Paragraph("TechCrunch AI & Startup Newsletter", title_style))
+    elements.append(Paragraph("TechCrunch AI & Startup Newsletter", TITLE_STYLE))
     today = datetime.now().strftime('%B %d, %Y')
-    elements.append(Paragraph(f"Weekly Report - {today}", heading_style))
+    elements.append(Paragraph(f"Weekly Report - {today}", HEADING_STYLE))
     elements.append(Spacer(1, 0.2*inch))
     
-    # Process content and handle markdown
-    paragraphs = content.split('\n\n')
-    for para in paragraphs:
-        if not para.strip():
-            continue
-            
-        # Clean up markdown formatting
-        text = para.strip()
-        # Remove markdown headers
-        text = text.replace('###', '').replace('##', '').replace('#', '')
-        # Remove markdown bold/italic
-        text = text.replace('**', '').replace('*', '')
-        # Convert markdown links to plain text
-        text = text.replace('[', '').replace(']', '').replace('(', '').replace(')', '')
-        
-        # Determine style based on content
-        style = body_style
-        if any(text.lower().startswith(h) for h in ['title:', 'source:', 'why it']):
-            style = heading_style
-            
-        # Handle bullet points
-        if text.startswith('- '):
-            text = '• ' + text[2:]
-            text = text.replace('\n- ', '\n• ')
-        
-        # Add paragraph with proper style
-        elements.append(Paragraph(text, style))
+    stories = _load_stories(content)
+    if stories is not None:
+        elements.extend(_iter_story_flowables(stories, HEADING_STYLE, BODY_STYLE))
+    else:
+        # Process content and handle markdown
+        elements.extend(_iter_paragraph_flowables(content, HEADING_STYLE, BODY_STYLE))
         
     # Build PDF
     doc.build(elements)
@@ -297,7 +816,48 @@ def generate_pdf_report(content):
     return filename
 
 
-def main():
+async def start_ollama_server(timeout=30):
+    """
+    Launch `ollama serve` with this process's environment and wait until it answers.
+    Returns None without launching anything if a server is already running.
+    """
+    try:
+        await client.list()
+        print("WARNING: an Ollama server is already running; it was NOT started by this script, "
+              "so OLLAMA_NUM_PARALLEL / OLLAMA_MAX_LOADED_MODELS from here do not apply to it")
+        return None
+    except Exception:
+        pass
+    
+    print(f"Starting ollama serve (OLLAMA_NUM_PARALLEL={os.environ['OLLAMA_NUM_PARALLEL']}, "
+          f"OLLAMA_MAX_LOADED_MODELS={os.environ['OLLAMA_MAX_LOADED_MODELS']})")
+    server = subprocess.Popen(['ollama', 'serve'], env=os.environ.copy())
+    
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await client.list()
+            return server
+        except Exception:
+            if server.poll() is not None or time.monotonic() > deadline:
+                stop_ollama_server(server)
+                raise RuntimeError("ollama serve did not start")
+            await asyncio.sleep(0.5)
+
+
+def stop_ollama_server(server, timeout=10):
+    """
+    Terminate a server started by start_ollama_server and reap the process
+    """
+    server.terminate()
+    try:
+        server.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+async def main_async():
     """
     Main execution pipeline
     """
@@ -310,15 +870,21 @@ def main():
     print(f"API Key: {'Set' if OLLAMA_API_KEY else 'Missing'}")
     print("="*70)
     
+    server = await start_ollama_server() if START_OLLAMA_SERVER else None
+    
     try:
         # Step 1: Gather news
-        news_data = gather_techcrunch_news()
+        news_data = await gather_techcrunch_news()
+        
+        # Fetch the articles stage 3 will likely need while stage 2 runs
+        for url in _extract_techcrunch_urls(news_data)[:PREFETCH_LIMIT]:
+            prefetch_web_fetch(url)
         
         # Step 2: Analyze and rank
-        ranked_news = analyze_and_rank_news(news_data)
+        stories, parsed = await analyze_and_rank_news(news_data)
         
         # Step 3: Create detailed summaries
-        detailed_summaries = create_detailed_summaries(ranked_news)
+        detailed_summaries = await create_detailed_summaries(stories, cache=parsed)
         
         # Step 4: Generate PDF
         pdf_file = generate_pdf_report(detailed_summaries)
@@ -335,6 +901,18 @@ def main():
         import traceback
         traceback.print_exc()
         raise
+    
+    finally:
+        _cancel_prefetches()
+        if server is not None:
+            stop_ollama_server(server)
+
+
+def main():
+    """
+    Synchronous entry point wrapping the async pipeline
+    """
+    return asyncio.run(main_async())
 
 
 if __name__ == "__main__":